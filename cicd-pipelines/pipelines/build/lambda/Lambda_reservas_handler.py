@@ -1,19 +1,69 @@
-import json
 import boto3
+import orjson
 import uuid
-from datetime import datetime, timedelta
-from decimal import Decimal
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 import os
+import time
 
-# Inicializar clientes AWS
-dynamodb = boto3.resource('dynamodb')
-ses = boto3.client('ses')
-sqs = boto3.client('sqs')
+# Inicializar clientes AWS (sessão e conexões reaproveitadas entre invocações)
+session = boto3.session.Session()
+config = Config(
+    tcp_keepalive=True,
+    max_pool_connections=32,
+    retries={'mode': 'adaptive', 'max_attempts': 5}
+)
+dynamodb = session.resource('dynamodb', config=config)
+ses = session.client('ses', config=config)
+sqs = session.client('sqs', config=config)
 
 # Tabelas DynamoDB
 reservas_table = dynamodb.Table(os.environ['RESERVAS_TABLE'])
 quartos_table = dynamodb.Table(os.environ['QUARTOS_TABLE'])
 clientes_table = dynamodb.Table(os.environ['CLIENTES_TABLE'])
+ocupacao_table = dynamodb.Table(os.environ['OCUPACAO_TABLE'])
+
+# TransactWriteItems aceita até 100 itens: reserva + cliente + uma trava por noite
+MAX_NOITES = 98
+
+class DeserializadorNumerico(TypeDeserializer):
+    """
+    Desserializador do DynamoDB Stream que converte números para int/float
+    (sem Decimal), para que cheguem como números no JSON da fila de BI
+    """
+    
+    def _deserialize_n(self, value):
+        return int(value) if value.lstrip('-').isdigit() else float(value)
+
+# Desserializador para os registros do DynamoDB Stream
+deserializer = DeserializadorNumerico()
+
+# Atributos de controle da reserva (índices e travas) que não vão para o BI
+ATRIBUTOS_INTERNOS_RESERVA = ('gsi_pk', 'checkin_ord', 'checkout_ord')
+
+# Pool de threads reutilizado entre invocações para consultas paralelas ao DynamoDB
+executor = ThreadPoolExecutor(max_workers=16)
+
+# Buffer de mensagens para a fila de BI (send_message_batch aceita até 10)
+BI_LOTE_MAXIMO = 10
+bi_buffer = []
+
+# Cache em memória dos quartos por tipo (tipo -> (quartos, expiração))
+CACHE_TTL_SEGUNDOS = 300
+cache_quartos = {}
+
+# Headers CORS para integração com Wix
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS,PUT,DELETE'
+}
+
+# Corpos pré-serializados das respostas de erro fixas
+ERRO_ACAO_JSON = orjson.dumps({'error': 'Ação não reconhecida'}).decode()
+ERRO_INTERNO_JSON = orjson.dumps({'error': 'Erro interno do servidor'}).decode()
 
 def lambda_handler(event, context):
     """
@@ -22,34 +72,29 @@ def lambda_handler(event, context):
     try:
         # Parse do evento
         if 'body' in event:
-            body = json.loads(event['body'])
+            body = orjson.loads(event['body'])
         else:
             body = event
             
         action = body.get('action', '')
         
         # Roteamento baseado na ação
-        if action == 'criar_reserva':
-            return criar_reserva(body)
-        elif action == 'consultar_disponibilidade':
-            return consultar_disponibilidade(body)
-        elif action == 'listar_reservas':
-            return listar_reservas(body)
-        elif action == 'cancelar_reserva':
-            return cancelar_reserva(body)
+        handler = ACOES.get(action)
+        if handler:
+            return handler(body)
         else:
             return {
                 'statusCode': 400,
-                'headers': headers_cors(),
-                'body': json.dumps({'error': 'Ação não reconhecida'})
+                'headers': CORS_HEADERS,
+                'body': ERRO_ACAO_JSON
             }
             
     except Exception as e:
         print(f"Erro no handler: {str(e)}")
         return {
             'statusCode': 500,
-            'headers': headers_cors(),
-            'body': json.dumps({'error': 'Erro interno do servidor'})
+            'headers': CORS_HEADERS,
+            'body': ERRO_INTERNO_JSON
         }
 
 def criar_reserva(data):
@@ -63,70 +108,66 @@ def criar_reserva(data):
             if campo not in data:
                 return erro_response(f'Campo obrigatório: {campo}')
         
-        # Verificar disponibilidade
-        disponibilidade = verificar_disponibilidade(
-            data['checkin'], 
-            data['checkout'], 
-            data['tipo_quarto']
-        )
-        
-        if not disponibilidade['disponivel']:
-            return erro_response('Quarto não disponível para as datas selecionadas')
+        noites = data_ordinal(data['checkout']) - data_ordinal(data['checkin'])
+        if noites < 1 or noites > MAX_NOITES:
+            return erro_response('Período de reserva inválido')
         
-        # Gerar ID único para a reserva
+        # Gerar ID único e timestamp da reserva (compartilhado com cliente e BI)
         reserva_id = str(uuid.uuid4())
+        agora = datetime.now().isoformat()
         
-        # Calcular valor total
-        valor_total = calcular_valor_reserva(
+        # Calcular valor total (em centavos)
+        valor_total_cents = calcular_valor_reserva(
             data['checkin'], 
             data['checkout'], 
             data['tipo_quarto'],
             data['num_hospedes']
         )
         
-        # Criar registro do cliente se não existir
-        criar_ou_atualizar_cliente(data)
-        
         # Criar reserva
         reserva = {
             'reserva_id': reserva_id,
+            'gsi_pk': 'R',  # partição única do checkin-index (consultas por período no BI)
             'cliente_email': data['cliente_email'],
             'cliente_nome': data.get('cliente_nome', ''),
             'cliente_telefone': data.get('cliente_telefone', ''),
             'checkin': data['checkin'],
             'checkout': data['checkout'],
+            'checkin_ord': data_ordinal(data['checkin']),
+            'checkout_ord': data_ordinal(data['checkout']),
             'tipo_quarto': data['tipo_quarto'],
             'num_hospedes': int(data['num_hospedes']),
-            'valor_total': Decimal(str(valor_total)),
+            'valor_total_cents': valor_total_cents,
             'status': 'confirmada',
-            'data_criacao': datetime.now().isoformat(),
+            'data_criacao': agora,
             'servicos_extras': data.get('servicos_extras', []),
             'observacoes': data.get('observacoes', '')
         }
         
-        # Salvar no DynamoDB
-        reservas_table.put_item(Item=reserva)
-        
-        # Atualizar disponibilidade do quarto
-        atualizar_disponibilidade_quarto(
-            data['tipo_quarto'], 
-            data['checkin'], 
-            data['checkout']
-        )
-        
-        # Enviar email de confirmação
-        enviar_email_confirmacao(reserva)
+        # Tentar reservar cada quarto do tipo; as travas por noite fazem a
+        # transação falhar se o quarto já estiver ocupado no período
+        for quarto in listar_quartos(data['tipo_quarto']):
+            reserva['quarto_id'] = quarto['quarto_id']
+            try:
+                registrar_reserva(reserva)
+                break
+            except dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+                if quarto_ocupado(e):
+                    continue
+                raise
+        else:
+            return erro_response('Quarto não disponível para as datas selecionadas')
         
-        # Enviar para fila de processamento de BI
-        enviar_para_fila_bi(reserva)
+        # Email de confirmação e fila de BI são disparados pelo stream da
+        # tabela de reservas (processar_stream_reservas), fora da resposta
         
         return {
             'statusCode': 200,
-            'headers': headers_cors(),
-            'body': json.dumps({
+            'headers': CORS_HEADERS,
+            'body': json_dumps({
                 'success': True,
                 'reserva_id': reserva_id,
-                'valor_total': float(valor_total),
+                'valor_total': valor_total_cents / 100,
                 'message': 'Reserva criada com sucesso!'
             })
         }
@@ -135,6 +176,40 @@ def criar_reserva(data):
         print(f"Erro ao criar reserva: {str(e)}")
         return erro_response('Erro ao processar reserva')
 
+def processar_stream_reservas(event, context):
+    """
+    Handler do DynamoDB Stream da tabela de reservas: envia email de
+    confirmação e dados para a fila de BI a cada nova reserva e libera as
+    travas de ocupação das reservas que deixam de estar confirmadas
+    """
+    try:
+        for record in event.get('Records', []):
+            if record['eventName'] != 'INSERT':
+                anterior = record['dynamodb'].get('OldImage', {})
+                atual = record['dynamodb'].get('NewImage', {})
+                if (anterior.get('status', {}).get('S') == 'confirmada'
+                        and atual.get('status', {}).get('S') != 'confirmada'):
+                    liberar_travas_ocupacao(
+                        {chave: deserializer.deserialize(valor) for chave, valor in anterior.items()}
+                    )
+                continue
+            
+            imagem = record['dynamodb']['NewImage']
+            reserva = {chave: deserializer.deserialize(valor) for chave, valor in imagem.items()}
+            
+            # Enviar email de confirmação
+            enviar_email_confirmacao(reserva)
+            
+            # Enviar para fila de processamento de BI (sem os atributos internos)
+            for atributo in ATRIBUTOS_INTERNOS_RESERVA:
+                reserva.pop(atributo, None)
+            enviar_para_fila_bi(reserva)
+    
+    finally:
+        # Enviar mensagens de BI que ainda estão no buffer, mesmo se um registro
+        # falhar, para não sobrarem no container reaproveitado pela próxima invocação
+        enviar_lote_bi()
+
 def consultar_disponibilidade(data):
     """
     Consulta disponibilidade de quartos para datas específicas
@@ -147,26 +222,28 @@ def consultar_disponibilidade(data):
         # Buscar quartos disponíveis
         quartos_disponiveis = []
         
-        # Query nos quartos
-        response = quartos_table.scan()
+        quartos = listar_quartos(tipo_quarto)
         
-        for quarto in response['Items']:
-            if tipo_quarto != 'todos' and quarto['tipo'] != tipo_quarto:
-                continue
-                
-            if verificar_quarto_disponivel(quarto['quarto_id'], checkin, checkout):
+        # Verificar cada quarto em paralelo (consultas limitadas por I/O)
+        resultados = executor.map(
+            lambda quarto: verificar_quarto_disponivel(quarto['quarto_id'], checkin, checkout),
+            quartos
+        )
+        
+        for quarto, disponivel in zip(quartos, resultados):
+            if disponivel:
                 quartos_disponiveis.append({
                     'quarto_id': quarto['quarto_id'],
                     'tipo': quarto['tipo'],
-                    'capacidade': quarto['capacidade'],
+                    'capacidade': int(quarto['capacidade']),
                     'preco_diaria': float(quarto['preco_diaria']),
                     'amenidades': quarto.get('amenidades', [])
                 })
         
         return {
             'statusCode': 200,
-            'headers': headers_cors(),
-            'body': json.dumps({
+            'headers': CORS_HEADERS,
+            'body': json_dumps({
                 'quartos_disponiveis': quartos_disponiveis,
                 'total_encontrados': len(quartos_disponiveis)
             })
@@ -176,143 +253,269 @@ def consultar_disponibilidade(data):
         print(f"Erro ao consultar disponibilidade: {str(e)}")
         return erro_response('Erro ao consultar disponibilidade')
 
-def verificar_disponibilidade(checkin, checkout, tipo_quarto):
-    """
-    Verifica se há quartos disponíveis do tipo solicitado
-    """
-    try:
-        # Buscar quartos do tipo solicitado
-        response = quartos_table.query(
-            IndexName='tipo-index',
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('tipo').eq(tipo_quarto)
-        )
-        
-        for quarto in response['Items']:
-            if verificar_quarto_disponivel(quarto['quarto_id'], checkin, checkout):
-                return {'disponivel': True, 'quarto_id': quarto['quarto_id']}
-        
-        return {'disponivel': False}
-        
-    except Exception as e:
-        print(f"Erro ao verificar disponibilidade: {str(e)}")
-        return {'disponivel': False}
-
 def verificar_quarto_disponivel(quarto_id, checkin, checkout):
     """
     Verifica se um quarto específico está disponível
     """
     try:
-        # Buscar reservas existentes para o quarto
-        response = reservas_table.query(
-            IndexName='quarto-data-index',
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('quarto_id').eq(quarto_id),
-            FilterExpression=boto3.dynamodb.conditions.Attr('status').eq('confirmada')
-        )
-        
-        checkin_date = datetime.fromisoformat(checkin)
-        checkout_date = datetime.fromisoformat(checkout)
+        checkin_ord = data_ordinal(checkin)
+        checkout_ord = data_ordinal(checkout)
+        
+        # Contar apenas reservas do quarto com checkout após o checkin pedido;
+        # o filtro de sobreposição roda no DynamoDB e só conta conflitos
+        kwargs = {
+            'IndexName': 'quarto-data-index',
+            'Select': 'COUNT',
+            'KeyConditionExpression': boto3.dynamodb.conditions.Key('quarto_id').eq(quarto_id) &
+                                      boto3.dynamodb.conditions.Key('checkout').gt(checkin),
+            'FilterExpression': boto3.dynamodb.conditions.Attr('status').eq('confirmada') &
+                                boto3.dynamodb.conditions.Attr('checkin_ord').lt(checkout_ord) &
+                                boto3.dynamodb.conditions.Attr('checkout_ord').gt(checkin_ord)
+        }
         
-        for reserva in response['Items']:
-            reserva_checkin = datetime.fromisoformat(reserva['checkin'])
-            reserva_checkout = datetime.fromisoformat(reserva['checkout'])
+        while True:
+            response = reservas_table.query(**kwargs)
             
-            # Verificar sobreposição de datas
-            if (checkin_date < reserva_checkout and checkout_date > reserva_checkin):
+            if response['Count'] > 0:
                 return False
-        
-        return True
+            
+            if 'LastEvaluatedKey' not in response:
+                return True
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
         
     except Exception as e:
         print(f"Erro ao verificar quarto: {str(e)}")
         return False
 
+def listar_quartos(tipo_quarto):
+    """
+    Lista os quartos de um tipo ('todos' para todos os tipos), mantendo o
+    resultado em cache no container durante CACHE_TTL_SEGUNDOS
+    """
+    agora = time.time()
+    em_cache = cache_quartos.get(tipo_quarto)
+    if em_cache and em_cache[1] > agora:
+        return em_cache[0]
+    
+    # Query no índice por tipo; scan apenas quando todos os tipos são pedidos
+    if tipo_quarto != 'todos':
+        quartos = paginar(
+            quartos_table.query,
+            IndexName='tipo-index',
+            KeyConditionExpression=boto3.dynamodb.conditions.Key('tipo').eq(tipo_quarto)
+        )
+    else:
+        quartos = paginar(
+            quartos_table.scan,
+            ProjectionExpression='quarto_id,tipo,capacidade,preco_diaria,amenidades'
+        )
+    
+    quartos = list(quartos)
+    cache_quartos[tipo_quarto] = (quartos, agora + CACHE_TTL_SEGUNDOS)
+    return quartos
+
 def calcular_valor_reserva(checkin, checkout, tipo_quarto, num_hospedes):
     """
-    Calcula o valor total da reserva
+    Calcula o valor total da reserva em centavos
     """
     try:
         # Obter preço do tipo de quarto
-        response = quartos_table.query(
-            IndexName='tipo-index',
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('tipo').eq(tipo_quarto),
-            Limit=1
-        )
+        quartos = listar_quartos(tipo_quarto)
         
-        if not response['Items']:
+        if not quartos:
             return 0
         
-        preco_diaria = float(response['Items'][0]['preco_diaria'])
+        preco_diaria_cents = int(quartos[0]['preco_diaria'] * 100)
         
         # Calcular número de noites
-        checkin_date = datetime.fromisoformat(checkin)
-        checkout_date = datetime.fromisoformat(checkout)
-        noites = (checkout_date - checkin_date).days
+        noites = data_ordinal(checkout) - data_ordinal(checkin)
         
         # Taxa extra por hóspede adicional (acima de 2)
-        taxa_extra_hospede = 0
+        num_hospedes = int(num_hospedes)
+        taxa_extra_hospede_cents = 0
         if num_hospedes > 2:
-            taxa_extra_hospede = (num_hospedes - 2) * 15  # $15 por hóspede adicional por noite
+            taxa_extra_hospede_cents = (num_hospedes - 2) * 1500  # $15 por hóspede adicional por noite
         
-        valor_total = (preco_diaria + taxa_extra_hospede) * noites
-        
-        return valor_total
+        return (preco_diaria_cents + taxa_extra_hospede_cents) * noites
         
     except Exception as e:
         print(f"Erro ao calcular valor: {str(e)}")
         return 0
 
-def criar_ou_atualizar_cliente(data):
+def formatar_centavos(valor_cents):
+    """
+    Formata um valor em centavos como string decimal (ex.: 12345 -> '123.45')
+    """
+    valor_cents = int(valor_cents)
+    return f'{valor_cents // 100}.{valor_cents % 100:02d}'
+
+def data_ordinal(data_iso):
+    """
+    Converte uma data ISO para o ordinal do dia (comparação por inteiros)
+    """
+    return datetime.fromisoformat(data_iso).toordinal()
+
+def migrar_datas_ordinais(event, context):
     """
-    Cria ou atualiza dados do cliente
+    Migração única: grava checkin_ord/checkout_ord e gsi_pk nas reservas antigas
     """
+    reservas = paginar(
+        reservas_table.scan,
+        FilterExpression=boto3.dynamodb.conditions.Attr('checkin_ord').not_exists() |
+                         boto3.dynamodb.conditions.Attr('gsi_pk').not_exists(),
+        ProjectionExpression='reserva_id,checkin,checkout'
+    )
+    
+    migradas = 0
+    for reserva in reservas:
+        reservas_table.update_item(
+            Key={'reserva_id': reserva['reserva_id']},
+            UpdateExpression='SET checkin_ord = :ci, checkout_ord = :co, gsi_pk = :pk',
+            ExpressionAttributeValues={
+                ':ci': data_ordinal(reserva['checkin']),
+                ':co': data_ordinal(reserva['checkout']),
+                ':pk': 'R'
+            }
+        )
+        migradas += 1
+    
+    return {'reservas_migradas': migradas}
+
+def migrar_travas_ocupacao(event, context):
+    """
+    Migração única: cria as travas por noite das reservas confirmadas
+    futuras feitas antes da tabela de ocupação
+    """
+    reservas = paginar(
+        reservas_table.scan,
+        FilterExpression=boto3.dynamodb.conditions.Attr('status').eq('confirmada') &
+                         boto3.dynamodb.conditions.Attr('quarto_id').exists() &
+                         boto3.dynamodb.conditions.Attr('checkout').gt(date.today().isoformat()),
+        ProjectionExpression='reserva_id,quarto_id,checkin,checkout'
+    )
+    
+    travas = 0
+    with ocupacao_table.batch_writer(overwrite_by_pkeys=['quarto_data']) as batch:
+        for reserva in reservas:
+            for dia in range(data_ordinal(reserva['checkin']), data_ordinal(reserva['checkout'])):
+                batch.put_item(Item={
+                    'quarto_data': chave_trava(reserva['quarto_id'], dia),
+                    'reserva_id': reserva['reserva_id']
+                })
+                travas += 1
+    
+    return {'travas_criadas': travas}
+
+def chave_trava(quarto_id, dia):
+    """
+    Chave da trava de ocupação de um quarto numa noite (quarto_id#YYYY-MM-DD)
+    """
+    return f"{quarto_id}#{date.fromordinal(dia).isoformat()}"
+
+def liberar_travas_ocupacao(reserva):
+    """
+    Remove as travas por noite de uma reserva cancelada ou apagada. Cada
+    trava só é removida se ainda pertencer à reserva, então reprocessar o
+    registro do stream não apaga travas de uma reserva posterior.
+    """
+    def liberar(dia):
+        try:
+            ocupacao_table.delete_item(
+                Key={'quarto_data': chave_trava(reserva['quarto_id'], dia)},
+                ConditionExpression='reserva_id = :r',
+                ExpressionAttributeValues={':r': reserva['reserva_id']}
+            )
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+    
     try:
-        cliente = {
-            'email': data['cliente_email'],
-            'nome': data.get('cliente_nome', ''),
-            'telefone': data.get('cliente_telefone', ''),
-            'ultima_atualizacao': datetime.now().isoformat()
-        }
-        
-        clientes_table.put_item(Item=cliente)
+        checkin_ord = reserva.get('checkin_ord') or data_ordinal(reserva['checkin'])
+        checkout_ord = reserva.get('checkout_ord') or data_ordinal(reserva['checkout'])
+        list(executor.map(liberar, range(checkin_ord, checkout_ord)))
         
     except Exception as e:
-        print(f"Erro ao salvar cliente: {str(e)}")
+        print(f"Erro ao liberar travas da reserva {reserva.get('reserva_id')}: {str(e)}")
+        raise
+
+def registrar_reserva(reserva):
+    """
+    Grava reserva, cliente e uma trava por noite do quarto numa única
+    TransactWriteItems. Cada trava (quarto_id#YYYY-MM-DD) só é criada se
+    ainda não existir, então reservas sobrepostas não podem ser confirmadas.
+    O cliente é atualizado sem condição (a última reserva prevalece), para
+    que uma atualização concorrente do perfil não cancele a reserva.
+    """
+    travas = [
+        {
+            'Put': {
+                'TableName': ocupacao_table.name,
+                'Item': {
+                    'quarto_data': chave_trava(reserva['quarto_id'], dia),
+                    'reserva_id': reserva['reserva_id']
+                },
+                'ConditionExpression': 'attribute_not_exists(quarto_data)'
+            }
+        }
+        for dia in range(reserva['checkin_ord'], reserva['checkout_ord'])
+    ]
+    
+    # Token idempotente por tentativa (reserva + quarto): um retry do SDK de
+    # uma transação já confirmada não é cancelado pelas próprias travas
+    dynamodb.meta.client.transact_write_items(
+        ClientRequestToken=str(uuid.uuid5(uuid.UUID(reserva['reserva_id']), reserva['quarto_id'])),
+        TransactItems=[
+            {
+                'Put': {
+                    'TableName': reservas_table.name,
+                    'Item': reserva,
+                    'ConditionExpression': 'attribute_not_exists(reserva_id)'
+                }
+            },
+            {
+                'Update': {
+                    'TableName': clientes_table.name,
+                    'Key': {'email': reserva['cliente_email']},
+                    'UpdateExpression': 'SET nome = :n, telefone = :t, ultima_atualizacao = :u',
+                    'ExpressionAttributeValues': {
+                        ':n': reserva['cliente_nome'],
+                        ':t': reserva['cliente_telefone'],
+                        ':u': reserva['data_criacao']
+                    }
+                }
+            },
+            *travas
+        ]
+    )
+
+def quarto_ocupado(erro):
+    """
+    Indica se a transação de registrar_reserva foi cancelada por alguma
+    trava de noite (itens a partir da posição 2) e não por reserva/cliente
+    """
+    motivos = erro.response.get('CancellationReasons', [])
+    return any(motivo.get('Code', 'None') != 'None' for motivo in motivos[2:])
 
 def enviar_email_confirmacao(reserva):
     """
     Envia email de confirmação da reserva
     """
     try:
-        html_template = f"""
-        <html>
-        <body>
-            <h2>Confirmação de Reserva - Hostal MAGIC</h2>
-            <p>Olá {reserva['cliente_nome']},</p>
-            <p>Sua reserva foi confirmada com sucesso!</p>
-            
-            <h3>Detalhes da Reserva:</h3>
-            <ul>
-                <li><strong>ID da Reserva:</strong> {reserva['reserva_id']}</li>
-                <li><strong>Check-in:</strong> {reserva['checkin']}</li>
-                <li><strong>Check-out:</strong> {reserva['checkout']}</li>
-                <li><strong>Tipo de Quarto:</strong> {reserva['tipo_quarto']}</li>
-                <li><strong>Número de Hóspedes:</strong> {reserva['num_hospedes']}</li>
-                <li><strong>Valor Total:</strong> ${reserva['valor_total']}</li>
-            </ul>
-            
-            <p>Estamos ansiosos para recebê-lo em Bacalar!</p>
-            <p>Hostal MAGIC Team</p>
-        </body>
-        </html>
-        """
+        # O HTML fica no template SES (Terraform); aqui só vão as variáveis
+        dados_template = {
+            'cliente_nome': reserva['cliente_nome'],
+            'reserva_id': reserva['reserva_id'],
+            'checkin': reserva['checkin'],
+            'checkout': reserva['checkout'],
+            'tipo_quarto': reserva['tipo_quarto'],
+            'num_hospedes': str(reserva['num_hospedes']),
+            'valor_total': formatar_centavos(reserva['valor_total_cents'])
+        }
         
-        ses.send_email(
+        ses.send_templated_email(
             Source=os.environ['FROM_EMAIL'],
             Destination={'ToAddresses': [reserva['cliente_email']]},
-            Message={
-                'Subject': {'Data': 'Confirmação de Reserva - Hostal MAGIC'},
-                'Body': {'Html': {'Data': html_template}}
-            }
+            Template=os.environ['CONFIRMACAO_TEMPLATE'],
+            TemplateData=json_dumps(dados_template)
         )
         
     except Exception as e:
@@ -320,32 +523,59 @@ def enviar_email_confirmacao(reserva):
 
 def enviar_para_fila_bi(reserva):
     """
-    Envia dados da reserva para fila de processamento de BI
+    Adiciona a reserva ao buffer da fila de processamento de BI
+    """
+    message = {
+        'tipo': 'nova_reserva',
+        'data': reserva,
+        'timestamp': reserva['data_criacao']
+    }
+    
+    bi_buffer.append(message)
+    
+    if len(bi_buffer) >= BI_LOTE_MAXIMO:
+        enviar_lote_bi()
+
+def enviar_lote_bi():
+    """
+    Envia as mensagens do buffer de BI com send_message_batch
     """
     try:
-        message = {
-            'tipo': 'nova_reserva',
-            'data': json.dumps(reserva, default=str),
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        sqs.send_message(
-            QueueUrl=os.environ['BI_QUEUE_URL'],
-            MessageBody=json.dumps(message)
-        )
+        while bi_buffer:
+            lote = bi_buffer[:BI_LOTE_MAXIMO]
+            del bi_buffer[:BI_LOTE_MAXIMO]
+            
+            response = sqs.send_message_batch(
+                QueueUrl=os.environ['BI_QUEUE_URL'],
+                Entries=[
+                    {'Id': str(i), 'MessageBody': json_dumps(message)}
+                    for i, message in enumerate(lote)
+                ]
+            )
+            
+            for falha in response.get('Failed', []):
+                print(f"Erro ao enviar para fila BI: {falha.get('Message', falha['Code'])}")
         
     except Exception as e:
         print(f"Erro ao enviar para fila BI: {str(e)}")
 
-def headers_cors():
+def paginar(operacao, **kwargs):
     """
-    Headers CORS para integração com Wix
+    Percorre todas as páginas de um query/scan seguindo LastEvaluatedKey
     """
-    return {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-        'Access-Control-Allow-Methods': 'GET,POST,OPTIONS,PUT,DELETE'
-    }
+    while True:
+        response = operacao(**kwargs)
+        yield from response['Items']
+        
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def json_dumps(obj):
+    """
+    Serializa para JSON com orjson (Decimal e demais tipos viram string)
+    """
+    return orjson.dumps(obj, default=str).decode()
 
 def erro_response(mensagem):
     """
@@ -353,6 +583,12 @@ def erro_response(mensagem):
     """
     return {
         'statusCode': 400,
-        'headers': headers_cors(),
-        'body': json.dumps({'error': mensagem})
-    }
\ No newline at end of file
+        'headers': CORS_HEADERS,
+        'body': json_dumps({'error': mensagem})
+    }
+
+# Tabela de roteamento das ações do handler principal
+ACOES = {
+    'criar_reserva': criar_reserva,
+    'consultar_disponibilidade': consultar_disponibilidade
+}
@@ -125,8 +125,9 @@ prepare_lambda_code() {
 # (O código já foi criado no artefato anterior)
 EOF
     
-    # Instalar dependências Python
-    pip3 install boto3 -t temp/lambda/reservas/
+    # Instalar dependências Python (wheels para o runtime Linux da Lambda)
+    pip3 install boto3 orjson -t temp/lambda/reservas/ \
+        --platform manylinux2014_x86_64 --python-version 3.9 --only-binary=:all:
     
     # Criar ZIP
     cd temp/lambda/reservas
@@ -3,15 +3,46 @@ Pipeline de Machine Learning e Business Intelligence
 Hostal MAGIC - Bacalar, México
 """
 
-import json
+from __future__ import annotations
+
+import importlib
 import boto3
-import pandas as pd
+import orjson
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from decimal import Decimal
+from functools import lru_cache
+import hashlib
+from html import escape
 import logging
-from typing import Dict, List, Any
+from operator import lt
+from typing import Dict, List, Any, Union
 import os
+import re
+import threading
+import time
+
+
+class _PandasSobDemanda:
+    """Importa o pandas no primeiro uso; handlers que não analisam dados não pagam a importação"""
+    
+    def __getattr__(self, nome):
+        global pd
+        pandas = importlib.import_module('pandas')
+        
+        # Copy-on-write: colunas derivadas e filtros não copiam dados até uma escrita
+        # (já é o padrão no pandas 3, onde a opção está descontinuada)
+        if int(pandas.__version__.split('.')[0]) < 3:
+            pandas.set_option('mode.copy_on_write', True)
+        
+        pd = pandas
+        return getattr(pandas, nome)
+
+
+pd = _PandasSobDemanda()
 
 # Configurar logging
 logger = logging.getLogger()
@@ -19,16 +50,172 @@ logger.setLevel(logging.INFO)
 
 # Clientes AWS
 dynamodb = boto3.resource('dynamodb')
+dynamodb_client = boto3.client('dynamodb')
 s3 = boto3.client('s3')
 sagemaker = boto3.client('sagemaker')
 quicksight = boto3.client('quicksight')
-ses = boto3.client('ses')
+ses = boto3.client('sesv2', config=Config(
+    connect_timeout=2,
+    read_timeout=5,  # Timeouts curtos: um SES lento não segura a Lambda até o timeout dela
+    tcp_keepalive=True,
+    max_pool_connections=14,  # Uma conexão por envio simultâneo (SES_MAX_ENVIOS_POR_SEGUNDO)
+    retries={'mode': 'adaptive', 'max_attempts': 3}
+))
 comprehend = boto3.client('comprehend')
+sns = boto3.client('sns', config=Config(max_pool_connections=10))
 
 # Configurações
 DATA_LAKE_BUCKET = os.environ.get('DATA_LAKE_BUCKET')
 ENVIRONMENT = os.environ.get('ENVIRONMENT', 'staging')
 
+# Remetente dos emails do pipeline
+FROM_EMAIL = os.environ.get('FROM_EMAIL')
+
+# Tópico SNS de erros do pipeline (assinado pela equipe técnica)
+ERROR_TOPIC_ARN = os.environ.get('ERROR_TOPIC_ARN')
+
+# Corpo (texto) do email de erro enviado à equipe técnica
+TEMPLATE_EMAIL_ERRO = (
+    "Erro detectado no pipeline de ML/BI:\n"
+    "\n"
+    "Timestamp: {timestamp}\n"
+    "Erro: {erro}\n"
+    "Dados de entrada: {entrada}\n"
+    "\n"
+    "Verifique os logs do CloudWatch para mais detalhes.\n"
+)
+
+# Relatório diário por email (template SES com assunto e corpo preenchidos pelo pipeline)
+RELATORIO_TEMPLATE = os.environ.get('RELATORIO_TEMPLATE', f'hostal-magic-relatorio-diario-{ENVIRONMENT}')
+GESTORES_EMAILS = [
+    'gestor@hostalmagic.com',  # Substituir por email real
+    'analytics@hostalmagic.com'
+]
+SES_DESTINOS_POR_LOTE = 50  # Limite de destinos por chamada de send_bulk_templated_email
+SES_MAX_ENVIOS_POR_SEGUNDO = 14  # Cota de envio da conta SES
+
+# Regras de alerta: (métrica, limite, comparação, alerta); a mensagem recebe o valor em {v}
+REGRAS_ALERTA = [
+    # Alerta de baixa receita
+    ('receita_total', 1000, lt, {  # Threshold configurável
+        'tipo': 'receita_baixa',
+        'prioridade': 'alta',
+        'mensagem': 'Receita abaixo do esperado: ${v:.2f}',
+        'acao_sugerida': 'Revisar estratégia de preços e promoções'
+    }),
+    # Alerta de poucas reservas
+    ('total_reservas', 10, lt, {  # Threshold configurável
+        'tipo': 'baixa_ocupacao',
+        'prioridade': 'media',
+        'mensagem': 'Apenas {v} reservas no período',
+        'acao_sugerida': 'Intensificar marketing digital e promoções'
+    }),
+    # Alerta de antecedência de reserva
+    ('antecedencia_media_dias', 3, lt, {
+        'tipo': 'reservas_ultima_hora',
+        'prioridade': 'baixa',
+        'mensagem': 'Muitas reservas de última hora (média: {v:.1f} dias)',
+        'acao_sugerida': 'Incentivar reservas antecipadas com desconto'
+    })
+]
+
+# Unidade para converter diferenças de datas (timedelta64) em dias inteiros
+UM_DIA = np.timedelta64(1, 'D')
+
+# Atributos de reserva lidos do DynamoDB para as análises
+COLUNAS_RESERVA = [
+    'reserva_id', 'cliente_email', 'checkin', 'checkout', 'tipo_quarto', 'num_hospedes',
+    'valor_total', 'valor_total_cents', 'status', 'data_criacao', 'servicos_extras'
+]
+
+# Chaves de agrupamento das análises, agregadas pelos códigos das categorias
+COLUNAS_CATEGORICAS = ['tipo_quarto', 'cliente_email', 'mes_checkin', 'dia_semana']
+
+# Projeção das queries de reservas ('status' é palavra reservada no DynamoDB)
+NOMES_ATRIBUTOS_RESERVA = {'#s': 'status'}
+PROJECAO_RESERVA = ','.join('#s' if coluna == 'status' else coluna for coluna in COLUNAS_RESERVA)
+
+# Feriados fixos no México, codificados como mes*100 + dia
+FERIADOS_MMDD = np.array([
+    101,   # Ano Novo
+    205,   # Dia da Constituição
+    321,   # Nascimento de Benito Juárez
+    501,   # Dia do Trabalho
+    916,   # Dia da Independência
+    1120,  # Revolução Mexicana
+    1225   # Natal
+], dtype=np.int32)
+
+# Meses de temporada alta
+MESES_TEMPORADA_ALTA = np.array([12, 1, 2, 7, 8], dtype=np.int32)
+
+# Segmentos de cliente por valor total gasto: (0, 100], (100, 300], (300, 1000], (1000, inf)
+SEGMENTOS_CLIENTE = ['Bronze', 'Prata', 'Ouro', 'Platino']
+LIMITES_SEGMENTO = np.array([0, 100, 300, 1000], dtype=np.float64)
+
+# Chamadas simultâneas ao Comprehend na análise de sentimento
+COMPREHEND_MAX_WORKERS = 8
+
+# Sentimentos retornados pelo Comprehend, na ordem dos códigos usados nas contagens
+SENTIMENTOS = ['POSITIVE', 'NEGATIVE', 'NEUTRAL', 'MIXED']
+CODIGO_SENTIMENTO = {sentimento: codigo for codigo, sentimento in enumerate(SENTIMENTOS)}
+
+# Palavras-chave de pontos de melhoria, compiladas em um padrão por categoria
+PALAVRAS_CHAVE_MELHORIA = {
+    'limpeza': ['sujo', 'limpo', 'limpeza', 'higiene'],
+    'atendimento': ['atendimento', 'staff', 'funcionário', 'serviço'],
+    'instalações': ['quarto', 'banheiro', 'instalação', 'estrutura'],
+    'wifi': ['wifi', 'internet', 'conexão'],
+    'ruído': ['barulho', 'ruído', 'silêncio', 'som'],
+    'localização': ['localização', 'local', 'acesso', 'transporte']
+}
+PADROES_MELHORIA = {
+    categoria: re.compile('|'.join(map(re.escape, palavras)))
+    for categoria, palavras in PALAVRAS_CHAVE_MELHORIA.items()
+}
+
+# Cache no data lake das reservas já extraídas, um objeto por dia de checkin
+CACHE_RESERVAS_PREFIX = 'cache/reservas/'
+CACHE_MAX_WORKERS = 8
+
+
+def json_dumps(obj, option: int = 0) -> bytes:
+    """Serializa para JSON com orjson (tipos NumPy nativos; demais tipos via str)"""
+    return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | option)
+
+
+class DeserializadorNumerico(TypeDeserializer):
+    """Desserializador DynamoDB que converte números direto para float (sem Decimal)"""
+    
+    def _deserialize_n(self, value):
+        return float(value)
+
+
+deserializador = DeserializadorNumerico()
+
+
+class LimitadorTaxa:
+    """Espaça chamadas entre threads para não passar de uma taxa por segundo"""
+    
+    def __init__(self, por_segundo: float):
+        self.intervalo = 1 / por_segundo
+        self.proximo = 0.0
+        self.lock = threading.Lock()
+    
+    def aguardar(self, quantidade: int = 1):
+        """Bloqueia até haver cota para `quantidade` envios"""
+        with self.lock:
+            agora = time.monotonic()
+            inicio = max(agora, self.proximo)
+            self.proximo = inicio + quantidade * self.intervalo
+        
+        time.sleep(inicio - agora)
+
+
+# Envios SES em paralelo, limitados à cota da conta
+executor_ses = ThreadPoolExecutor(max_workers=SES_MAX_ENVIOS_POR_SEGUNDO)
+limitador_ses = LimitadorTaxa(SES_MAX_ENVIOS_POR_SEGUNDO)
+
 class HostalAnalytics:
     """Classe principal para análises do hostal"""
     
@@ -40,51 +227,154 @@ class HostalAnalytics:
     def extrair_dados_reservas(self, data_inicio: str, data_fim: str) -> pd.DataFrame:
         """Extrai dados de reservas para análise"""
         try:
-            # Scan da tabela de reservas
-            response = self.reservas_table.scan(
-                FilterExpression=boto3.dynamodb.conditions.Attr('checkin').between(data_inicio, data_fim)
-            )
+            return self._montar_dataframe_reservas(self._consultar_reservas(data_inicio, data_fim))
             
-            reservas = []
-            for item in response['Items']:
-                reserva = {
-                    'reserva_id': item['reserva_id'],
-                    'cliente_email': item['cliente_email'],
-                    'checkin': item['checkin'],
-                    'checkout': item['checkout'],
-                    'tipo_quarto': item['tipo_quarto'],
-                    'num_hospedes': int(item['num_hospedes']),
-                    'valor_total': float(item['valor_total']),
-                    'status': item['status'],
-                    'data_criacao': item['data_criacao'],
-                    'servicos_extras': item.get('servicos_extras', [])
-                }
-                reservas.append(reserva)
+        except Exception as e:
+            logger.error(f"Erro ao extrair dados de reservas: {str(e)}")
+            return pd.DataFrame()
+    
+    def extrair_dados_reservas_cache(self, data_inicio: str, data_fim: str) -> pd.DataFrame:
+        """Extrai dados de reservas reaproveitando os dias já fechados salvos no S3"""
+        try:
+            dias = pd.date_range(data_inicio, data_fim).strftime('%Y-%m-%d').tolist()
+            hoje = datetime.now().strftime('%Y-%m-%d')
             
-            df = pd.DataFrame(reservas)
+            # Dias com checkin já passado não mudam mais e podem vir do cache
+            dias_em_cache = self._dias_em_cache(data_inicio, data_fim)
+            dias_cache = [dia for dia in dias if dia < hoje and dia in dias_em_cache]
+            dias_consulta = [dia for dia in dias if dia not in dias_em_cache or dia >= hoje]
             
-            if not df.empty:
-                # Converter datas
-                df['checkin'] = pd.to_datetime(df['checkin'])
-                df['checkout'] = pd.to_datetime(df['checkout'])
-                df['data_criacao'] = pd.to_datetime(df['data_criacao'])
-                
-                # Calcular métricas derivadas
-                df['noites'] = (df['checkout'] - df['checkin']).dt.days
-                df['valor_por_noite'] = df['valor_total'] / df['noites']
-                df['mes_checkin'] = df['checkin'].dt.to_period('M')
-                df['semana_checkin'] = df['checkin'].dt.isocalendar().week
-                df['dia_semana'] = df['checkin'].dt.day_name()
+            itens_por_dia = {dia: [] for dia in dias}
+            
+            with ThreadPoolExecutor(max_workers=CACHE_MAX_WORKERS) as executor:
+                for dia, itens_dia in zip(dias_cache, executor.map(self._ler_cache_dia, dias_cache)):
+                    itens_por_dia[dia] = itens_dia
                 
-            return df
+                if dias_consulta:
+                    # Uma única query cobre todos os dias fora do cache
+                    consulta = set(dias_consulta)
+                    for item in self._consultar_reservas(dias_consulta[0], data_fim):
+                        dia = item['checkin'][:10]
+                        if dia in consulta:
+                            itens_por_dia[dia].append(item)
+                    
+                    # Salvar os dias fechados para as próximas execuções
+                    dias_fechados = [dia for dia in dias_consulta if dia < hoje]
+                    list(executor.map(self._salvar_cache_dia, dias_fechados, [itens_por_dia[dia] for dia in dias_fechados]))
+            
+            return self._montar_dataframe_reservas([item for dia in dias for item in itens_por_dia[dia]])
             
         except Exception as e:
-            logger.error(f"Erro ao extrair dados de reservas: {str(e)}")
+            logger.error(f"Erro ao extrair dados de reservas com cache: {str(e)}")
+            return self.extrair_dados_reservas(data_inicio, data_fim)
+    
+    def _dias_em_cache(self, data_inicio: str, data_fim: str) -> set:
+        """Lista os dias do período que já têm cache no S3"""
+        paginator = s3.get_paginator('list_objects_v2')
+        paginas = paginator.paginate(
+            Bucket=DATA_LAKE_BUCKET,
+            Prefix=CACHE_RESERVAS_PREFIX,
+            StartAfter=f"{CACHE_RESERVAS_PREFIX}dt={data_inicio}"
+        )
+        
+        dias = set()
+        for pagina in paginas:
+            for objeto in pagina.get('Contents', []):
+                dia = objeto['Key'][len(CACHE_RESERVAS_PREFIX) + 3:len(CACHE_RESERVAS_PREFIX) + 13]
+                if dia > data_fim:
+                    return dias
+                dias.add(dia)
+        
+        return dias
+    
+    def _chave_cache_dia(self, dia: str) -> str:
+        """Chave S3 do cache de um dia de checkin"""
+        return f"{CACHE_RESERVAS_PREFIX}dt={dia}/reservas.json"
+    
+    def _ler_cache_dia(self, dia: str) -> List[Dict[str, Any]]:
+        """Lê do S3 as reservas de um dia de checkin"""
+        response = s3.get_object(Bucket=DATA_LAKE_BUCKET, Key=self._chave_cache_dia(dia))
+        return orjson.loads(response['Body'].read())
+    
+    def _salvar_cache_dia(self, dia: str, itens: List[Dict[str, Any]]):
+        """Salva no S3 as reservas de um dia de checkin já fechado"""
+        s3.put_object(
+            Bucket=DATA_LAKE_BUCKET,
+            Key=self._chave_cache_dia(dia),
+            Body=json_dumps(itens)
+        )
+    
+    def _consultar_reservas(self, data_inicio: str, data_fim: str) -> List[Dict[str, Any]]:
+        """Lê do DynamoDB as reservas com checkin no período"""
+        # Query paginada no checkin-index (partição única gsi_pk='R'),
+        # lendo apenas o período pedido e os atributos usados na análise.
+        # Usa o client de baixo nível para desserializar números como float
+        paginator = dynamodb_client.get_paginator('query')
+        paginas = paginator.paginate(
+            TableName=self.reservas_table.name,
+            IndexName='checkin-index',
+            KeyConditionExpression='gsi_pk = :pk AND checkin BETWEEN :inicio AND :fim',
+            ProjectionExpression=PROJECAO_RESERVA,
+            ExpressionAttributeNames=NOMES_ATRIBUTOS_RESERVA,
+            ExpressionAttributeValues={
+                ':pk': {'S': 'R'},
+                ':inicio': {'S': data_inicio},
+                ':fim': {'S': data_fim}
+            }
+        )
+        
+        return [
+            {atributo: deserializador.deserialize(valor) for atributo, valor in item.items()}
+            for pagina in paginas for item in pagina['Items']
+        ]
+    
+    def _montar_dataframe_reservas(self, itens: Union[List[Dict[str, Any]], Dict[str, List]]) -> pd.DataFrame:
+        """Monta o DataFrame de análise a partir dos itens de reserva (ou de um dict de colunas, nos testes)"""
+        if not itens:
             return pd.DataFrame()
+        
+        # Montar o DataFrame direto dos itens e converter tipos por coluna
+        if isinstance(itens, dict):
+            df = pd.DataFrame(itens, columns=COLUNAS_RESERVA)
+        else:
+            df = pd.DataFrame.from_records(itens, columns=COLUNAS_RESERVA)
+        df['num_hospedes'] = df['num_hospedes'].astype(np.int16)
+        valor_cents = df.pop('valor_total_cents').astype(np.float64) / 100
+        df['valor_total'] = valor_cents.fillna(df['valor_total'].astype(np.float64))
+        df['servicos_extras'] = [s if isinstance(s, list) else [] for s in df['servicos_extras']]
+        
+        # Converter datas
+        df['checkin'] = pd.to_datetime(df['checkin'])
+        df['checkout'] = pd.to_datetime(df['checkout'])
+        df['data_criacao'] = pd.to_datetime(df['data_criacao'])
+        
+        # Calcular métricas derivadas
+        df['noites'] = (df['checkout'].to_numpy() - df['checkin'].to_numpy()) // UM_DIA
+        df['valor_por_noite'] = df['valor_total'] / df['noites']
+        df['mes_checkin'] = df['checkin'].dt.strftime('%Y-%m').astype('category')
+        df['semana_checkin'] = df['checkin'].dt.isocalendar().week
+        df['dia_semana'] = df['checkin'].dt.day_name().astype('category')
+        
+        # Strings repetidas e chaves de agrupamento como categorias
+        df = df.astype({'tipo_quarto': 'category', 'status': 'category', 'cliente_email': 'category'})
+        
+        # Ordenar por cliente (estável: mantém a ordem de checkin dentro de cada cliente)
+        # para que as reservas de cada cliente fiquem contíguas
+        return df.sort_values('cliente_email', kind='stable', ignore_index=True)
+    
+    def _com_chaves_categoricas(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Garante as chaves de agrupamento como categorias (o .cat das agregações exige)"""
+        # DataFrames montados fora de _montar_dataframe_reservas podem ter as chaves como texto
+        conversoes = {
+            coluna: 'category' for coluna in COLUNAS_CATEGORICAS
+            if coluna in df.columns and not isinstance(df[coluna].dtype, pd.CategoricalDtype)
+        }
+        return df.astype(conversoes) if conversoes else df
     
     def calcular_metricas_ocupacao(self, df_reservas: pd.DataFrame) -> Dict[str, Any]:
         """Calcula métricas de ocupação"""
         try:
+            df_reservas = self._com_chaves_categoricas(df_reservas)
             if df_reservas.empty:
                 return {}
             
@@ -94,29 +384,43 @@ class HostalAnalytics:
             receita_media_reserva = df_reservas['valor_total'].mean()
             noites_total = df_reservas['noites'].sum()
             
+            # Agregações por categoria com bincount sobre os códigos das categorias;
+            # valores ausentes somam zero e ficam fora do denominador da média
+            valor = df_reservas['valor_total'].to_numpy()
+            valor_presente = ~np.isnan(valor)
+            colunas = {
+                'valor_total': np.where(valor_presente, valor, 0.0),
+                'valor_presente': valor_presente,
+                'noites': df_reservas['noites'].to_numpy()
+            }
+            
             # Ocupação por tipo de quarto
-            ocupacao_por_tipo = df_reservas.groupby('tipo_quarto').agg({
-                'reserva_id': 'count',
-                'valor_total': 'sum',
-                'noites': 'sum'
-            }).to_dict()
+            tipos, contagem, somas = self._agregar_por_categoria(df_reservas['tipo_quarto'], colunas)
+            ocupacao_por_tipo = {
+                'reserva_id': dict(zip(tipos, contagem.tolist())),
+                'valor_total': dict(zip(tipos, somas['valor_total'].tolist())),
+                'noites': dict(zip(tipos, somas['noites'].astype(np.int64).tolist()))
+            }
             
             # Sazonalidade mensal
-            sazonalidade_mensal = df_reservas.groupby('mes_checkin').agg({
-                'reserva_id': 'count',
-                'valor_total': 'sum'
-            }).to_dict()
+            meses, contagem, somas = self._agregar_por_categoria(df_reservas['mes_checkin'], colunas)
+            sazonalidade_mensal = {
+                'reserva_id': dict(zip(meses, contagem.tolist())),
+                'valor_total': dict(zip(meses, somas['valor_total'].tolist()))
+            }
             
             # Tendência por dia da semana
-            tendencia_semanal = df_reservas.groupby('dia_semana').agg({
-                'reserva_id': 'count',
-                'valor_total': 'mean'
-            }).to_dict()
+            dias, contagem, somas = self._agregar_por_categoria(df_reservas['dia_semana'], colunas)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                valor_medio_dia = somas['valor_total'] / somas['valor_presente']
+            tendencia_semanal = {
+                'reserva_id': dict(zip(dias, contagem.tolist())),
+                'valor_total': dict(zip(dias, valor_medio_dia.tolist()))
+            }
             
-            # Antecedência média de reserva
-            df_reservas_temp = df_reservas.copy()
-            df_reservas_temp['antecedencia'] = (df_reservas_temp['checkin'] - df_reservas_temp['data_criacao']).dt.days
-            antecedencia_media = df_reservas_temp['antecedencia'].mean()
+            # Antecedência média de reserva (direto nos arrays, sem copiar o DataFrame)
+            antecedencia = (df_reservas['checkin'].to_numpy() - df_reservas['data_criacao'].to_numpy()) // UM_DIA
+            antecedencia_media = antecedencia.mean()
             
             metricas = {
                 'total_reservas': total_reservas,
@@ -135,40 +439,77 @@ class HostalAnalytics:
             logger.error(f"Erro ao calcular métricas de ocupação: {str(e)}")
             return {}
     
+    def _agregar_por_categoria(self, chave: pd.Series, colunas: Dict[str, np.ndarray]):
+        """Conta linhas e soma colunas por categoria observada de uma coluna categórica"""
+        categorias = chave.cat.categories
+        codigos = chave.cat.codes.to_numpy()
+        validos = codigos >= 0
+        codigos = codigos[validos]
+        
+        contagem = np.bincount(codigos, minlength=len(categorias))
+        observadas = np.flatnonzero(contagem)
+        somas = {
+            nome: np.bincount(codigos, weights=valores[validos], minlength=len(categorias))[observadas]
+            for nome, valores in colunas.items()
+        }
+        
+        return categorias[observadas].tolist(), contagem[observadas], somas
+    
     def analisar_clientes(self, df_reservas: pd.DataFrame) -> Dict[str, Any]:
         """Análise de perfil de clientes"""
         try:
+            df_reservas = self._com_chaves_categoricas(df_reservas)
             if df_reservas.empty:
                 return {}
             
-            # Clientes por valor total gasto
-            clientes_valor = df_reservas.groupby('cliente_email').agg({
-                'valor_total': 'sum',
-                'reserva_id': 'count',
-                'noites': 'sum'
-            }).sort_values('valor_total', ascending=False)
+            # Clientes por valor total gasto (e-mails ausentes são ignorados)
+            chave = df_reservas['cliente_email']
+            valor = df_reservas['valor_total'].to_numpy()
+            colunas = {
+                'valor_total': np.where(np.isnan(valor), 0.0, valor),
+                'noites': df_reservas['noites'].to_numpy()
+            }
+            codigos = chave.cat.codes.to_numpy()
+            n = np.count_nonzero(codigos >= 0)
             
-            # Top 10 clientes
-            top_clientes = clientes_valor.head(10).to_dict()
+            if (np.diff(codigos[:n]) >= 0).all() and (codigos[n:] < 0).all():
+                # Reservas ordenadas por cliente (como em _montar_dataframe_reservas):
+                # soma direta dos blocos contíguos de cada cliente
+                inicios = np.flatnonzero(np.diff(codigos[:n], prepend=-1))
+                clientes = chave.cat.categories[codigos[inicios]]
+                contagem = np.diff(inicios, append=n)
+                somas = {nome: np.add.reduceat(valores[:n], inicios) for nome, valores in colunas.items()}
+            else:
+                # Qualquer outra ordem: soma por código de categoria
+                clientes, contagem, somas = self._agregar_por_categoria(chave, colunas)
             
-            # Segmentação de clientes
-            clientes_valor['categoria'] = pd.cut(
-                clientes_valor['valor_total'], 
-                bins=[0, 100, 300, 1000, float('inf')], 
-                labels=['Bronze', 'Prata', 'Ouro', 'Platino']
-            )
+            clientes_valor = pd.DataFrame({
+                'valor_total': somas['valor_total'],
+                'reserva_id': contagem,
+                'noites': somas['noites'].astype(np.int64)
+            }, index=clientes)
+            
+            # Top 10 clientes (seleção parcial em O(n) e ordenação só dos 10)
+            valores = clientes_valor['valor_total'].to_numpy()
+            k = min(10, len(valores))
+            top_idx = np.argpartition(-valores, k - 1)[:k]
+            top_idx = top_idx[np.argsort(-valores[top_idx], kind='stable')]
+            top_clientes = clientes_valor.iloc[top_idx].to_dict()
             
-            segmentacao = clientes_valor['categoria'].value_counts().to_dict()
+            # Segmentação de clientes (intervalos fechados à direita, valores <= 0 ficam fora)
+            segmentos = np.searchsorted(LIMITES_SEGMENTO, valores, side='left') - 1
+            contagem_segmentos = np.bincount(segmentos[segmentos >= 0], minlength=len(SEGMENTOS_CLIENTE))
+            segmentacao = dict(zip(SEGMENTOS_CLIENTE, contagem_segmentos.tolist()))
             
             # Clientes recorrentes
-            clientes_recorrentes = clientes_valor[clientes_valor['reserva_id'] > 1]
-            taxa_recorrencia = len(clientes_recorrentes) / len(clientes_valor) * 100
+            recorrentes = clientes_valor['reserva_id'].to_numpy() > 1
+            taxa_recorrencia = recorrentes.mean() * 100
             
             analise_clientes = {
                 'total_clientes_unicos': len(clientes_valor),
                 'top_clientes': top_clientes,
                 'segmentacao': segmentacao,
-                'clientes_recorrentes': len(clientes_recorrentes),
+                'clientes_recorrentes': int(recorrentes.sum()),
                 'taxa_recorrencia_pct': float(taxa_recorrencia),
                 'valor_medio_cliente': float(clientes_valor['valor_total'].mean())
             }
@@ -206,8 +547,9 @@ class PrevisaoDemanda:
             dados_diarios['dia_semana'] = dados_diarios['data'].dt.dayofweek
             dados_diarios['mes'] = dados_diarios['data'].dt.month
             dados_diarios['dia_ano'] = dados_diarios['data'].dt.dayofyear
-            dados_diarios['eh_feriado'] = dados_diarios['data'].apply(self._eh_feriado_mexico)
-            dados_diarios['eh_temporada_alta'] = dados_diarios['mes'].isin([12, 1, 2, 7, 8])
+            mmdd = dados_diarios['mes'].to_numpy() * 100 + dados_diarios['data'].dt.day.to_numpy()
+            dados_diarios['eh_feriado'] = np.isin(mmdd, FERIADOS_MMDD)
+            dados_diarios['eh_temporada_alta'] = np.isin(dados_diarios['mes'].to_numpy(), MESES_TEMPORADA_ALTA)
             
             # Features de lag
             dados_diarios['reservas_lag_7'] = dados_diarios['reservas'].shift(7)
@@ -221,20 +563,6 @@ class PrevisaoDemanda:
             logger.error(f"Erro ao preparar dados de previsão: {str(e)}")
             return pd.DataFrame()
     
-    def _eh_feriado_mexico(self, data: datetime) -> bool:
-        """Verifica se a data é feriado no México"""
-        feriados_fixos = [
-            (1, 1),   # Ano Novo
-            (2, 5),   # Dia da Constituição
-            (3, 21),  # Nascimento de Benito Juárez
-            (5, 1),   # Dia do Trabalho
-            (9, 16),  # Dia da Independência
-            (11, 20), # Revolução Mexicana
-            (12, 25)  # Natal
-        ]
-        
-        return (data.month, data.day) in feriados_fixos
-    
     def gerar_previsao_demanda(self, dados_historicos: pd.DataFrame, dias_previsao: int = 30) -> Dict[str, Any]:
         """Gera previsão de demanda usando modelo simples"""
         try:
@@ -249,36 +577,40 @@ class PrevisaoDemanda:
             sazonalidade_semanal = dados_historicos.groupby('dia_semana')['reservas'].mean()
             
             # Calcular tendência
-            dados_historicos['indice'] = range(len(dados_historicos))
-            correlacao_tendencia = dados_historicos['indice'].corr(dados_historicos['reservas'])
+            indice = pd.Series(np.arange(len(dados_historicos)), index=dados_historicos.index)
+            correlacao_tendencia = indice.corr(dados_historicos['reservas'])
             
-            # Gerar previsões
+            # Gerar previsões para todos os dias de uma vez
             data_inicio = dados_historicos['data'].max() + timedelta(days=1)
-            previsoes = []
+            dias = np.arange(dias_previsao)
+            datas = pd.date_range(data_inicio, periods=dias_previsao, freq='D')
             
-            for i in range(dias_previsao):
-                data_previsao = data_inicio + timedelta(days=i)
-                dia_semana = data_previsao.weekday()
-                
-                # Previsão base
-                previsao_base = media_reservas
-                
-                # Ajuste sazonal
-                fator_sazonal = sazonalidade_semanal.get(dia_semana, 1) / media_reservas
-                
-                # Ajuste de tendência
-                ajuste_tendencia = correlacao_tendencia * i * 0.1
-                
-                # Previsão final
-                previsao = max(0, previsao_base * fator_sazonal + ajuste_tendencia)
-                
-                previsoes.append({
-                    'data': data_previsao.strftime('%Y-%m-%d'),
-                    'previsao_reservas': round(previsao, 2),
+            # Ajuste sazonal (dias da semana sem histórico usam 1, como antes)
+            sazonalidade = sazonalidade_semanal.reindex(range(7), fill_value=1).to_numpy(dtype=np.float64)
+            fator_sazonal = sazonalidade[datas.dayofweek.to_numpy()] / media_reservas
+            
+            # Ajuste de tendência
+            ajuste_tendencia = correlacao_tendencia * dias * 0.1
+            
+            # Previsão final (fmax: com tendência NaN, p.ex. uma única linha de
+            # histórico, a previsão vale 0 como no max(0, nan) do cálculo por dia)
+            previsao = np.fmax(0, media_reservas * fator_sazonal + ajuste_tendencia)
+            
+            previsoes = [
+                {
+                    'data': data,
+                    'previsao_reservas': valor,
                     'confianca': 0.8,  # Placeholder para confiança
-                    'limite_inferior': round(previsao * 0.7, 2),
-                    'limite_superior': round(previsao * 1.3, 2)
-                })
+                    'limite_inferior': inferior,
+                    'limite_superior': superior
+                }
+                for data, valor, inferior, superior in zip(
+                    datas.strftime('%Y-%m-%d'),
+                    np.round(previsao, 2).tolist(),
+                    np.round(previsao * 0.7, 2).tolist(),
+                    np.round(previsao * 1.3, 2).tolist()
+                )
+            ]
             
             return {
                 'previsoes': previsoes,
@@ -308,43 +640,117 @@ class SistemaRecomendacao:
     
     def gerar_recomendacoes_cliente(self, cliente_email: str, df_reservas: pd.DataFrame) -> Dict[str, Any]:
         """Gera recomendações personalizadas para um cliente"""
+        # Histórico do cliente
+        historico_cliente = df_reservas[df_reservas['cliente_email'] == cliente_email]
+        
+        if historico_cliente.empty:
+            return self._recomendacoes_cliente_novo()
+        
+        recomendacoes = self.gerar_recomendacoes_clientes(historico_cliente)
+        return recomendacoes[0]['recomendacoes'] if recomendacoes else {}
+    
+    def gerar_recomendacoes_clientes(self, df_reservas: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Gera recomendações para todos os clientes com uma agregação por atributo do perfil"""
         try:
-            # Histórico do cliente
-            historico_cliente = df_reservas[df_reservas['cliente_email'] == cliente_email]
-            
-            if historico_cliente.empty:
-                return self._recomendacoes_cliente_novo()
-            
-            # Análise do perfil
-            tipo_quarto_preferido = historico_cliente['tipo_quarto'].mode().iloc[0]
-            valor_medio_gasto = historico_cliente['valor_total'].mean()
-            servicos_extras_usados = []
-            
-            for servicos in historico_cliente['servicos_extras']:
-                if isinstance(servicos, list):
-                    servicos_extras_usados.extend(servicos)
-            
-            servicos_preferidos = list(set(servicos_extras_usados))
-            
-            # Meses de visita preferidos
-            meses_visita = historico_cliente['checkin'].dt.month.tolist()
-            mes_preferido = max(set(meses_visita), key=meses_visita.count)
-            
-            # Gerar recomendações
-            recomendacoes = {
-                'tipo_quarto_sugerido': tipo_quarto_preferido,
-                'servicos_sugeridos': servicos_preferidos[:3],  # Top 3
-                'melhor_epoca_visita': self._nome_mes(mes_preferido),
-                'oferta_personalizada': self._gerar_oferta_personalizada(valor_medio_gasto),
-                'atividades_sugeridas': self._sugerir_atividades_perfil(historico_cliente),
-                'desconto_fidelidade': min(len(historico_cliente) * 5, 25)  # Max 25%
-            }
+            # Clientes na ordem da primeira reserva (e-mail ausente fica com código -1)
+            codigos, clientes = pd.factorize(df_reservas['cliente_email'])
+            validos = codigos >= 0
+            num_clientes = len(clientes)
+            
+            num_reservas = np.bincount(codigos[validos], minlength=num_clientes)
+            valor_medio = self._media_por_cliente(codigos, df_reservas['valor_total'], num_clientes)
+            hospedes_medio = self._media_por_cliente(codigos, df_reservas['num_hospedes'], num_clientes)
+            
+            # Tipo de quarto preferido (empate fica com o primeiro tipo, como no mode())
+            codigos_tipo, tipos = pd.factorize(df_reservas['tipo_quarto'], sort=True)
+            tipo_preferido = self._moda_por_cliente(codigos, codigos_tipo, num_clientes, len(tipos))
+            
+            # Mês de visita preferido (empate fica com o menor mês)
+            meses = df_reservas['checkin'].dt.month.to_numpy(dtype=float)
+            codigos_mes = np.where(np.isnan(meses), 0, meses).astype(np.int64) - 1
+            mes_preferido = self._moda_por_cliente(codigos, codigos_mes, num_clientes, 12)
+            
+            servicos_preferidos = self._servicos_por_cliente(codigos, df_reservas['servicos_extras'], num_clientes)
+            
+            recomendacoes = []
+            for i, cliente in enumerate(clientes):
+                # Sem tipo de quarto ou data de check-in não há perfil para recomendar
+                if tipo_preferido[i] < 0 or mes_preferido[i] < 0:
+                    recomendacoes.append({'cliente_email': cliente, 'recomendacoes': {}})
+                    continue
+                
+                recomendacoes.append({
+                    'cliente_email': cliente,
+                    'recomendacoes': {
+                        'tipo_quarto_sugerido': tipos[tipo_preferido[i]],
+                        'servicos_sugeridos': servicos_preferidos[i],  # Top 3
+                        'melhor_epoca_visita': self._nome_mes(int(mes_preferido[i]) + 1),
+                        'oferta_personalizada': self._gerar_oferta_personalizada(valor_medio[i]),
+                        'atividades_sugeridas': self._sugerir_atividades_perfil(valor_medio[i], hospedes_medio[i]),
+                        'desconto_fidelidade': min(int(num_reservas[i]) * 5, 25)  # Max 25%
+                    }
+                })
             
             return recomendacoes
             
         except Exception as e:
             logger.error(f"Erro ao gerar recomendações: {str(e)}")
-            return {}
+            return []
+    
+    def _media_por_cliente(self, codigos: np.ndarray, coluna: pd.Series, num_clientes: int) -> np.ndarray:
+        """Média de uma coluna numérica por cliente, ignorando valores ausentes"""
+        valores = coluna.to_numpy(dtype=float)
+        presentes = (codigos >= 0) & ~np.isnan(valores)
+        
+        somas = np.bincount(codigos[presentes], weights=valores[presentes], minlength=num_clientes)
+        quantidades = np.bincount(codigos[presentes], minlength=num_clientes)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return somas / quantidades
+    
+    def _moda_por_cliente(self, codigos: np.ndarray, codigos_valor: np.ndarray,
+                          num_clientes: int, num_valores: int) -> np.ndarray:
+        """Código do valor mais frequente por cliente (-1 sem valores); empate fica com o menor código"""
+        if num_valores == 0:
+            return np.full(num_clientes, -1)
+        
+        validos = (codigos >= 0) & (codigos_valor >= 0)
+        tabela = np.bincount(
+            codigos[validos] * num_valores + codigos_valor[validos],
+            minlength=num_clientes * num_valores
+        ).reshape(num_clientes, num_valores)
+        
+        return np.where(tabela.any(axis=1), tabela.argmax(axis=1), -1)
+    
+    def _servicos_por_cliente(self, codigos: np.ndarray, servicos: pd.Series,
+                              num_clientes: int, limite: int = 3) -> List[List[str]]:
+        """Serviços extras mais usados por cliente; empate fica com o serviço usado primeiro"""
+        listas = [s if isinstance(s, list) else [] for s in servicos]
+        tamanhos = np.fromiter((len(s) for s in listas), dtype=np.int64, count=len(listas))
+        codigos_servico, nomes = pd.factorize(
+            np.array([servico for s in listas for servico in s], dtype=object)
+        )
+        
+        num_servicos = max(len(nomes), 1)
+        
+        # Contagem e primeira ocorrência de cada par (cliente, serviço)
+        cliente_servico = np.repeat(codigos, tamanhos)
+        validos = (cliente_servico >= 0) & (codigos_servico >= 0)
+        pares, primeiras, contagens = np.unique(
+            cliente_servico[validos] * num_servicos + codigos_servico[validos],
+            return_index=True, return_counts=True
+        )
+        cliente_par = pares // num_servicos
+        
+        # Ordena por cliente, contagem decrescente e primeira ocorrência
+        ordem = np.lexsort((primeiras, -contagens, cliente_par))
+        
+        preferidos = [[] for _ in range(num_clientes)]
+        for cliente, servico in zip(cliente_par[ordem].tolist(), (pares[ordem] % num_servicos).tolist()):
+            if len(preferidos[cliente]) < limite:
+                preferidos[cliente].append(nomes[servico])
+        
+        return preferidos
     
     def _recomendacoes_cliente_novo(self) -> Dict[str, Any]:
         """Recomendações para clientes novos"""
@@ -375,11 +781,8 @@ class SistemaRecomendacao:
         else:
             return "Café da manhã gratuito por 2 dias"
     
-    def _sugerir_atividades_perfil(self, historico: pd.DataFrame) -> List[str]:
+    def _sugerir_atividades_perfil(self, valor_medio: float, num_hospedes_medio: float) -> List[str]:
         """Sugere atividades baseadas no perfil"""
-        valor_medio = historico['valor_total'].mean()
-        num_hospedes_medio = historico['num_hospedes'].mean()
-        
         atividades = []
         
         if valor_medio > 150:
@@ -391,7 +794,7 @@ class SistemaRecomendacao:
         # Atividades básicas sempre incluídas
         atividades.extend(['Kayak', 'Stand-up paddle', 'Tour cenotes'])
         
-        return list(set(atividades))[:5]  # Max 5 sugestões
+        return list(dict.fromkeys(atividades))[:5]  # Max 5 sugestões, na ordem de prioridade
 
 
 class AnalisesSentimento:
@@ -406,47 +809,39 @@ class AnalisesSentimento:
             # Dividir em lotes (Comprehend tem limite de 25 textos por chamada)
             lotes = [textos_avaliacoes[i:i+25] for i in range(0, len(textos_avaliacoes), 25)]
             
-            resultados_sentimento = []
+            # Lotes enviados em paralelo; map preserva a ordem dos lotes
+            with ThreadPoolExecutor(max_workers=min(COMPREHEND_MAX_WORKERS, len(lotes))) as executor:
+                respostas = executor.map(self._detectar_sentimento_lote, lotes)
+                resultados_sentimento = [resultado for response in respostas for resultado in response['ResultList']]
             
-            for lote in lotes:
-                response = comprehend.batch_detect_sentiment(
-                    TextList=lote,
-                    LanguageCode='pt'  # Português
-                )
-                
-                resultados_sentimento.extend(response['ResultList'])
-            
-            # Processar resultados
-            sentimentos = {
-                'POSITIVE': 0,
-                'NEGATIVE': 0,
-                'NEUTRAL': 0,
-                'MIXED': 0
-            }
-            
-            scores_positivos = []
-            scores_negativos = []
-            avaliacoes_negativas = []
+            # Processar resultados em arrays pré-alocados
+            n = len(resultados_sentimento)
+            codigos = np.empty(n, dtype=np.int8)
+            scores_positivos = np.empty(n, dtype=np.float64)
+            scores_negativos = np.empty(n, dtype=np.float64)
             
             for i, resultado in enumerate(resultados_sentimento):
-                sentimento = resultado['Sentiment']
                 scores = resultado['SentimentScore']
-                
-                sentimentos[sentimento] += 1
-                scores_positivos.append(scores['Positive'])
-                scores_negativos.append(scores['Negative'])
-                
-                # Coletar avaliações negativas para análise
-                if sentimento == 'NEGATIVE' and scores['Negative'] > 0.7:
-                    avaliacoes_negativas.append({
-                        'texto': textos_avaliacoes[i],
-                        'score_negativo': scores['Negative']
-                    })
+                codigos[i] = CODIGO_SENTIMENTO[resultado['Sentiment']]
+                scores_positivos[i] = scores['Positive']
+                scores_negativos[i] = scores['Negative']
+            
+            contagens = np.bincount(codigos, minlength=len(SENTIMENTOS))
+            sentimentos = dict(zip(SENTIMENTOS, contagens.tolist()))
+            
+            # Coletar avaliações negativas para análise
+            indices_negativos = np.flatnonzero(
+                (codigos == CODIGO_SENTIMENTO['NEGATIVE']) & (scores_negativos > 0.7)
+            )
+            avaliacoes_negativas = [
+                {'texto': textos_avaliacoes[i], 'score_negativo': float(scores_negativos[i])}
+                for i in indices_negativos
+            ]
             
             # Calcular métricas
             total_avaliacoes = len(textos_avaliacoes)
             satisfacao_geral = (sentimentos['POSITIVE'] / total_avaliacoes) * 100
-            score_medio_positivo = np.mean(scores_positivos)
+            score_medio_positivo = scores_positivos.mean()
             
             # Identificar pontos de melhoria
             pontos_melhoria = self._identificar_pontos_melhoria(avaliacoes_negativas)
@@ -467,26 +862,24 @@ class AnalisesSentimento:
             logger.error(f"Erro na análise de sentimento: {str(e)}")
             return {}
     
+    def _detectar_sentimento_lote(self, lote: List[str]) -> Dict[str, Any]:
+        """Detecta o sentimento de um lote de até 25 textos"""
+        return comprehend.batch_detect_sentiment(
+            TextList=lote,
+            LanguageCode='pt'  # Português
+        )
+    
     def _identificar_pontos_melhoria(self, avaliacoes_negativas: List[Dict]) -> List[str]:
         """Identifica pontos de melhoria baseados em avaliações negativas"""
-        palavras_chave = {
-            'limpeza': ['sujo', 'limpo', 'limpeza', 'higiene'],
-            'atendimento': ['atendimento', 'staff', 'funcionário', 'serviço'],
-            'instalações': ['quarto', 'banheiro', 'instalação', 'estrutura'],
-            'wifi': ['wifi', 'internet', 'conexão'],
-            'ruído': ['barulho', 'ruído', 'silêncio', 'som'],
-            'localização': ['localização', 'local', 'acesso', 'transporte']
-        }
-        
         problemas_identificados = {}
         
+        # Cada categoria conta no máximo uma vez por avaliação
         for avaliacao in avaliacoes_negativas:
             texto = avaliacao['texto'].lower()
             
-            for categoria, palavras in palavras_chave.items():
-                for palavra in palavras:
-                    if palavra in texto:
-                        problemas_identificados[categoria] = problemas_identificados.get(categoria, 0) + 1
+            for categoria, padrao in PADROES_MELHORIA.items():
+                if padrao.search(texto):
+                    problemas_identificados[categoria] = problemas_identificados.get(categoria, 0) + 1
         
         # Ordenar por frequência
         pontos_melhoria = sorted(problemas_identificados.items(), key=lambda x: x[1], reverse=True)
@@ -546,6 +939,7 @@ def lambda_modelo_recomendacao(event, context):
     """Lambda para modelo de recomendação"""
     try:
         logger.info("Iniciando modelo de recomendação")
+        agora = datetime.now()
         
         analytics = HostalAnalytics()
         recomendacao = SistemaRecomendacao()
@@ -560,29 +954,21 @@ def lambda_modelo_recomendacao(event, context):
             logger.warning("Nenhuma reserva encontrada para o período")
             return {'recomendacoes': []}
         
-        # Gerar recomendações para clientes únicos
-        clientes_unicos = df_reservas['cliente_email'].unique()
-        recomendacoes_geradas = []
-        
-        for cliente in clientes_unicos[:50]:  # Limitar a 50 para performance
-            recom_cliente = recomendacao.gerar_recomendacoes_cliente(cliente, df_reservas)
-            recomendacoes_geradas.append({
-                'cliente_email': cliente,
-                'recomendacoes': recom_cliente
-            })
+        # Gerar recomendações para todos os clientes únicos
+        recomendacoes_geradas = recomendacao.gerar_recomendacoes_clientes(df_reservas)
         
         # Salvar resultados no S3
         resultado = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': agora.isoformat(),
             'total_clientes_processados': len(recomendacoes_geradas),
             'recomendacoes': recomendacoes_geradas
         }
         
-        s3_key = f"ml_results/recomendacoes/{datetime.now().strftime('%Y-%m-%d')}.json"
+        s3_key = f"ml_results/recomendacoes/{agora.strftime('%Y-%m-%d')}.json"
         s3.put_object(
             Bucket=DATA_LAKE_BUCKET,
             Key=s3_key,
-            Body=json.dumps(resultado, default=str)
+            Body=json_dumps(resultado)
         )
         
         logger.info(f"Modelo de recomendação concluído. Resultados salvos em {s3_key}")
@@ -618,7 +1004,7 @@ def lambda_processar_sentimento(event, context):
         s3.put_object(
             Bucket=DATA_LAKE_BUCKET,
             Key=s3_key,
-            Body=json.dumps(resultado_analise, default=str)
+            Body=json_dumps(resultado_analise)
         )
         
         logger.info("Análise de sentimento processada com sucesso")
@@ -638,11 +1024,12 @@ def lambda_gerar_relatorios(event, context):
         previsao = PrevisaoDemanda()
         
         # Calcular período (últimos 30 dias por padrão)
-        end_date = datetime.now()
+        agora = datetime.now()
+        end_date = agora
         start_date = end_date - timedelta(days=30)
         
-        # Extrair e analisar dados
-        df_reservas = analytics.extrair_dados_reservas(
+        # Extrair e analisar dados (dias já fechados vêm do cache no S3)
+        df_reservas = analytics.extrair_dados_reservas_cache(
             start_date.strftime('%Y-%m-%d'),
             end_date.strftime('%Y-%m-%d')
         )
@@ -665,15 +1052,15 @@ def lambda_gerar_relatorios(event, context):
             'previsao_demanda': previsao_demanda,
             'insights_principais': gerar_insights_principais(metricas_ocupacao, analise_clientes),
             'alertas': gerar_alertas_gestao(metricas_ocupacao),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': agora.isoformat()
         }
         
         # Salvar relatório no S3
-        s3_key = f"reports/relatorio_consolidado_{datetime.now().strftime('%Y-%m-%d')}.json"
+        s3_key = f"reports/relatorio_consolidado_{agora.strftime('%Y-%m-%d')}.json"
         s3.put_object(
             Bucket=DATA_LAKE_BUCKET,
             Key=s3_key,
-            Body=json.dumps(relatorio_consolidado, default=str, indent=2)
+            Body=json_dumps(relatorio_consolidado, orjson.OPT_INDENT_2)
         )
         
         logger.info(f"Relatório consolidado gerado: {s3_key}")
@@ -736,38 +1123,34 @@ def lambda_notificar_gestores(event, context):
     """Lambda para notificar gestores com insights e alertas"""
     try:
         logger.info("Enviando notificações para gestores")
+        agora = datetime.now()
         
         insights = event.get('insights', [])
         alertas = event.get('alertas', [])
         metricas = event.get('metricas', {})
         
-        # Preparar email
-        html_body = gerar_email_relatorio(insights, alertas, metricas)
-        
-        # Enviar email
-        response = ses.send_email(
-            Source=os.environ.get('FROM_EMAIL'),
-            Destination={
-                'ToAddresses': [
-                    'gestor@hostalmagic.com',  # Substituir por email real
-                    'analytics@hostalmagic.com'
-                ]
-            },
-            Message={
-                'Subject': {
-                    'Data': f'Relatório Diário - Hostal MAGIC - {datetime.now().strftime("%d/%m/%Y")}'
-                },
-                'Body': {
-                    'Html': {'Data': html_body}
-                }
-            }
-        )
+        # Preparar email (o mesmo conteúdo vai para todos os destinatários)
+        html_body = gerar_email_relatorio(insights, alertas, metricas, agora)
+        dados_template = json_dumps({
+            'data': agora.strftime("%d/%m/%Y"),
+            'corpo': html_body
+        }).decode()
+        
+        # Enviar email em lotes de até 50 destinatários por chamada, lotes em paralelo
+        lotes = [GESTORES_EMAILS[i:i + SES_DESTINOS_POR_LOTE] for i in range(0, len(GESTORES_EMAILS), SES_DESTINOS_POR_LOTE)]
+        respostas = executor_ses.map(lambda lote: enviar_lote_relatorio(lote, dados_template), lotes)
+        envios = [envio for response in respostas for envio in response['BulkEmailEntryResults']]
+        
+        falhas = [envio for envio in envios if envio.get('Status', 'SUCCESS') != 'SUCCESS']
+        if falhas:
+            logger.error(f"Falha ao enviar {len(falhas)} notificações: {falhas}")
+        else:
+            logger.info("Notificações enviadas com sucesso")
         
-        logger.info("Notificações enviadas com sucesso")
         return {
-            'email_sent': True,
-            'message_id': response['MessageId'],
-            'timestamp': datetime.now().isoformat()
+            'email_sent': not falhas,
+            'message_ids': [envio['MessageId'] for envio in envios if 'MessageId' in envio],
+            'timestamp': agora.isoformat()
         }
         
     except Exception as e:
@@ -779,6 +1162,7 @@ def lambda_tratar_erro(event, context):
     """Lambda para tratar erros do pipeline"""
     try:
         logger.error("Tratando erro do pipeline")
+        agora_iso = datetime.now().isoformat()
         
         error_info = event.get('error', {})
         input_data = event.get('input', {})
@@ -787,33 +1171,29 @@ def lambda_tratar_erro(event, context):
         logger.error(f"Erro no pipeline: {error_info}")
         logger.error(f"Dados de entrada: {input_data}")
         
-        # Notificar equipe técnica
-        ses.send_email(
-            Source=os.environ.get('FROM_EMAIL'),
-            Destination={
-                'ToAddresses': ['tech@hostalmagic.com']  # Substituir por email real
-            },
-            Message={
-                'Subject': {'Data': 'ERRO - Pipeline ML/BI Hostal MAGIC'},
-                'Body': {
-                    'Text': {
-                        'Data': f"""
-                        Erro detectado no pipeline de ML/BI:
-                        
-                        Timestamp: {datetime.now().isoformat()}
-                        Erro: {error_info}
-                        Dados de entrada: {input_data}
-                        
-                        Verifique os logs do CloudWatch para mais detalhes.
-                        """
-                    }
-                }
-            }
+        # Notificar equipe técnica via SNS (entrega e retentativas ficam com o SNS).
+        # Assinaturas de email recebem o texto; as demais recebem o evento em JSON.
+        sns.publish(
+            TopicArn=ERROR_TOPIC_ARN,
+            Subject='ERRO - Pipeline ML/BI Hostal MAGIC',
+            MessageStructure='json',
+            Message=json_dumps({
+                'default': json_dumps({
+                    'error': error_info,
+                    'input': input_data,
+                    'timestamp': agora_iso
+                }).decode(),
+                'email': TEMPLATE_EMAIL_ERRO.format_map({
+                    'timestamp': agora_iso,
+                    'erro': error_info,
+                    'entrada': input_data
+                })
+            }).decode()
         )
         
         return {
             'error_handled': True,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': agora_iso
         }
         
     except Exception as e:
@@ -823,33 +1203,53 @@ def lambda_tratar_erro(event, context):
 
 # ========== FUNÇÕES AUXILIARES ==========
 
+def enviar_lote_relatorio(destinatarios: List[str], dados_template: str) -> Dict[str, Any]:
+    """Envia o relatório para um lote de destinatários respeitando a cota do SES"""
+    limitador_ses.aguardar(len(destinatarios))
+    
+    return ses.send_bulk_email(
+        FromEmailAddress=FROM_EMAIL,
+        DefaultContent={
+            'Template': {
+                'TemplateName': RELATORIO_TEMPLATE,
+                'TemplateData': dados_template
+            }
+        },
+        BulkEmailEntries=[{'Destination': {'ToAddresses': [email]}} for email in destinatarios]
+    )
+
+
 def gerar_insights_principais(metricas_ocupacao: Dict, analise_clientes: Dict) -> List[str]:
     """Gera insights principais baseados nas métricas"""
     insights = []
     
     try:
-        if metricas_ocupacao.get('receita_total', 0) > 0:
-            receita_total = metricas_ocupacao['receita_total']
-            total_reservas = metricas_ocupacao['total_reservas']
-            
+        mo = metricas_ocupacao
+        receita_total = mo.get('receita_total', 0)
+        total_reservas = mo.get('total_reservas', 0)
+        media = mo.get('receita_media_reserva')
+        antecedencia = mo.get('antecedencia_media_dias')
+        
+        if receita_total > 0:
             insights.append(f"Receita total do período: ${receita_total:.2f} com {total_reservas} reservas")
-            
-            if metricas_ocupacao.get('receita_media_reserva'):
-                media = metricas_ocupacao['receita_media_reserva']
-                insights.append(f"Ticket médio por reserva: ${media:.2f}")
-            
-            if metricas_ocupacao.get('antecedencia_media_dias'):
-                antecedencia = metricas_ocupacao['antecedencia_media_dias']
-                insights.append(f"Antecedência média de reserva: {antecedencia:.1f} dias")
+            insights.extend(
+                modelo.format(valor)
+                for modelo, valor in (
+                    ("Ticket médio por reserva: ${:.2f}", media),
+                    ("Antecedência média de reserva: {:.1f} dias", antecedencia),
+                )
+                if valor
+            )
         
-        if analise_clientes.get('taxa_recorrencia_pct'):
-            taxa = analise_clientes['taxa_recorrencia_pct']
+        taxa = analise_clientes.get('taxa_recorrencia_pct')
+        if taxa:
             insights.append(f"Taxa de clientes recorrentes: {taxa:.1f}%")
         
         # Insights sobre tipos de quarto mais populares
-        ocupacao_por_tipo = metricas_ocupacao.get('ocupacao_por_tipo', {})
-        if ocupacao_por_tipo:
-            tipo_mais_popular = max(ocupacao_por_tipo.get('reserva_id', {}), key=ocupacao_por_tipo.get('reserva_id', {}).get)
+        reservas_por_tipo = mo.get('ocupacao_por_tipo', {}).get('reserva_id') or {}
+        if reservas_por_tipo:
+            contagens = np.fromiter(reservas_por_tipo.values(), dtype=np.float64, count=len(reservas_por_tipo))
+            tipo_mais_popular = list(reservas_por_tipo)[int(contagens.argmax())]
             insights.append(f"Tipo de quarto mais popular: {tipo_mais_popular}")
     
     except Exception as e:
@@ -864,36 +1264,10 @@ def gerar_alertas_gestao(metricas_ocupacao: Dict) -> List[Dict]:
     alertas = []
     
     try:
-        receita_total = metricas_ocupacao.get('receita_total', 0)
-        total_reservas = metricas_ocupacao.get('total_reservas', 0)
-        
-        # Alerta de baixa receita
-        if receita_total < 1000:  # Threshold configurável
-            alertas.append({
-                'tipo': 'receita_baixa',
-                'prioridade': 'alta',
-                'mensagem': f'Receita abaixo do esperado: ${receita_total:.2f}',
-                'acao_sugerida': 'Revisar estratégia de preços e promoções'
-            })
-        
-        # Alerta de poucas reservas
-        if total_reservas < 10:  # Threshold configurável
-            alertas.append({
-                'tipo': 'baixa_ocupacao',
-                'prioridade': 'media',
-                'mensagem': f'Apenas {total_reservas} reservas no período',
-                'acao_sugerida': 'Intensificar marketing digital e promoções'
-            })
-        
-        # Alerta de antecedência de reserva
-        antecedencia = metricas_ocupacao.get('antecedencia_media_dias', 0)
-        if antecedencia < 3:
-            alertas.append({
-                'tipo': 'reservas_ultima_hora',
-                'prioridade': 'baixa',
-                'mensagem': f'Muitas reservas de última hora (média: {antecedencia:.1f} dias)',
-                'acao_sugerida': 'Incentivar reservas antecipadas com desconto'
-            })
+        for chave, limite, comparar, alerta in REGRAS_ALERTA:
+            valor = metricas_ocupacao.get(chave, 0)
+            if comparar(valor, limite):
+                alertas.append({**alerta, 'mensagem': alerta['mensagem'].format(v=valor)})
     
     except Exception as e:
         logger.error(f"Erro ao gerar alertas: {str(e)}")
@@ -901,86 +1275,130 @@ def gerar_alertas_gestao(metricas_ocupacao: Dict) -> List[Dict]:
     return alertas
 
 
-def gerar_email_relatorio(insights: List[str], alertas: List[Dict], metricas: Dict) -> str:
-    """Gera HTML do email com relatório"""
-    
-    html = f"""
+# Partes fixas do HTML do relatório
+CABECALHO_ANTES_DATA = """
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="UTF-8">
         <style>
-            body {{ font-family: Arial, sans-serif; margin: 20px; }}
-            .header {{ background-color: #2E86AB; color: white; padding: 20px; text-align: center; }}
-            .section {{ margin: 20px 0; padding: 15px; border-left: 4px solid #2E86AB; }}
-            .alert-alta {{ background-color: #ffebee; border-left-color: #f44336; }}
-            .alert-media {{ background-color: #fff3e0; border-left-color: #ff9800; }}
-            .alert-baixa {{ background-color: #e8f5e9; border-left-color: #4caf50; }}
-            .metric {{ background-color: #f5f5f5; padding: 10px; margin: 5px 0; border-radius: 5px; }}
-            ul {{ padding-left: 20px; }}
-            li {{ margin: 8px 0; }}
+            body { font-family: Arial, sans-serif; margin: 20px; }
+            .header { background-color: #2E86AB; color: white; padding: 20px; text-align: center; }
+            .section { margin: 20px 0; padding: 15px; border-left: 4px solid #2E86AB; }
+            .alert-alta { background-color: #ffebee; border-left-color: #f44336; }
+            .alert-media { background-color: #fff3e0; border-left-color: #ff9800; }
+            .alert-baixa { background-color: #e8f5e9; border-left-color: #4caf50; }
+            .metric { background-color: #f5f5f5; padding: 10px; margin: 5px 0; border-radius: 5px; }
+            ul { padding-left: 20px; }
+            li { margin: 8px 0; }
         </style>
     </head>
     <body>
         <div class="header">
             <h1>🏖️ Hostal MAGIC - Relatório Diário</h1>
-            <p>{datetime.now().strftime('%d de %B de %Y')}</p>
+            <p>"""
+
+# Entre as duas partes entra a data do relatório
+CABECALHO_DEPOIS_DATA = """</p>
         </div>
         
         <div class="section">
             <h2>📊 Insights Principais</h2>
             <ul>
     """
+
+TEMPLATE_RELATORIO_ALERTA = """
+            <div class="metric alert-{prioridade}">
+                <strong>{tipo}</strong><br>
+                {mensagem}<br>
+                <em>Ação sugerida: {acao}</em>
+            </div>
+            """
+
+TEMPLATE_RELATORIO_RODAPE = """
+        <div class="section">
+            <p><em>Este relatório foi gerado automaticamente pelo sistema de BI do Hostal MAGIC.</em></p>
+            <p>Para mais detalhes, acesse o dashboard no QuickSight.</p>
+        </div>
+    </body>
+    </html>
+    """
+
+
+@lru_cache(maxsize=128)
+def _rotulo_metrica(chave: str) -> str:
+    """Rótulo HTML (já escapado) de uma chave de métrica; as chaves são um conjunto pequeno e fixo"""
+    return escape(chave.replace('_', ' ').title())
+
+
+# HTMLs de relatório já renderizados, por hash das entradas (mais antigo sai primeiro)
+EMAILS_RELATORIO_CACHE_MAX = 32
+emails_renderizados: Dict[bytes, str] = {}
+
+
+def gerar_email_relatorio(insights: List[str], alertas: List[Dict], metricas: Dict, agora: datetime = None) -> str:
+    """Gera HTML do email com relatório (reaproveita o HTML se as entradas se repetirem)"""
+    data = (agora or datetime.now()).strftime('%d de %B de %Y')
+    
+    chave = hashlib.sha1(json_dumps([data, insights, alertas, metricas], orjson.OPT_SORT_KEYS)).digest()
+    html_body = emails_renderizados.get(chave)
+    if html_body is None:
+        html_body = _renderizar_email_relatorio(insights, alertas, metricas, data)
+        if len(emails_renderizados) >= EMAILS_RELATORIO_CACHE_MAX:
+            emails_renderizados.pop(next(iter(emails_renderizados)))
+        emails_renderizados[chave] = html_body
+    
+    return html_body
+
+
+def _renderizar_email_relatorio(insights: List[str], alertas: List[Dict], metricas: Dict, data: str) -> str:
+    """Monta o HTML do relatório a partir dos templates do módulo"""
+    # Partes acumuladas em lista e unidas uma única vez; textos dinâmicos escapados
+    partes = [CABECALHO_ANTES_DATA, data, CABECALHO_DEPOIS_DATA]
     
-    for insight in insights:
-        html += f"<li>{insight}</li>"
+    partes.extend(f"<li>{escape(str(insight))}</li>" for insight in insights)
     
-    html += """
+    partes.append("""
             </ul>
         </div>
-    """
+    """)
     
     if alertas:
-        html += """
+        partes.append("""
         <div class="section">
             <h2>⚠️ Alertas</h2>
-        """
-        
-        for alerta in alertas:
-            prioridade_class = f"alert-{alerta.get('prioridade', 'baixa')}"
-            html += f"""
-            <div class="metric {prioridade_class}">
-                <strong>{alerta.get('tipo', '').upper()}</strong><br>
-                {alerta.get('mensagem', '')}<br>
-                <em>Ação sugerida: {alerta.get('acao_sugerida', '')}</em>
-            </div>
-            """
+        """)
+        
+        partes.append(''.join(
+            TEMPLATE_RELATORIO_ALERTA.format(
+                prioridade=escape(alerta.get('prioridade', 'baixa')),
+                tipo=escape(alerta.get('tipo', '').upper()),
+                mensagem=escape(alerta.get('mensagem', '')),
+                acao=escape(alerta.get('acao_sugerida', ''))
+            )
+            for alerta in alertas
+        ))
         
-        html += "</div>"
+        partes.append("</div>")
     
     # Adicionar métricas se disponíveis
     if metricas:
-        html += """
+        partes.append("""
         <div class="section">
             <h2>📈 Métricas Resumidas</h2>
-        """
+        """)
         
-        for chave, valor in metricas.items():
-            if isinstance(valor, (int, float)):
-                html += f'<div class="metric"><strong>{chave.replace("_", " ").title()}:</strong> {valor}</div>'
+        partes.extend(
+            f'<div class="metric"><strong>{_rotulo_metrica(chave)}:</strong> {valor}</div>'
+            for chave, valor in metricas.items()
+            if isinstance(valor, (int, float))
+        )
         
-        html += "</div>"
+        partes.append("</div>")
     
-    html += """
-        <div class="section">
-            <p><em>Este relatório foi gerado automaticamente pelo sistema de BI do Hostal MAGIC.</em></p>
-            <p>Para mais detalhes, acesse o dashboard no QuickSight.</p>
-        </div>
-    </body>
-    </html>
-    """
+    partes.append(TEMPLATE_RELATORIO_RODAPE)
     
-    return html
+    return ''.join(partes)
 
 
 # Função principal para testes locais
@@ -988,8 +1406,8 @@ if __name__ == "__main__":
     # Teste das classes principais
     analytics = HostalAnalytics()
     
-    # Simular dados para teste
-    dados_teste = pd.DataFrame({
+    # Simular dados para teste (tipados pelo mesmo caminho da extração)
+    dados_teste = analytics._montar_dataframe_reservas({
         'reserva_id': ['res_001', 'res_002', 'res_003'],
         'cliente_email': ['teste1@email.com', 'teste2@email.com', 'teste1@email.com'],
         'checkin': ['2024-01-15', '2024-01-20', '2024-02-10'],
@@ -1004,7 +1422,7 @@ if __name__ == "__main__":
     
     print("Testando análises...")
     metricas = analytics.calcular_metricas_ocupacao(dados_teste)
-    print("Métricas de ocupação:", json.dumps(metricas, indent=2, default=str))
+    print("Métricas de ocupação:", json_dumps(metricas, orjson.OPT_INDENT_2).decode())
     
     analise_clientes = analytics.analisar_clientes(dados_teste)
-    print("Análise de clientes:", json.dumps(analise_clientes, indent=2, default=str))
\ No newline at end of file
+    print("Análise de clientes:", json_dumps(analise_clientes, orjson.OPT_INDENT_2).decode())
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Testes locais do pipeline de ML/BI (sem chamadas à AWS)
+"""
+
+import math
+import os
+
+# Os clientes boto3 são criados na importação do módulo e só precisam de uma região
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import pandas as pd
+
+from ml_bi_pipeline import PrevisaoDemanda, SistemaRecomendacao
+
+
+def montar_historico(reservas):
+    """Histórico diário no formato de preparar_dados_previsao (colunas usadas pela previsão)"""
+    datas = pd.date_range('2024-03-01', periods=len(reservas), freq='D')
+    return pd.DataFrame({
+        'data': datas,
+        'reservas': reservas,
+        'dia_semana': datas.dayofweek
+    })
+
+
+def valores_previstos(resultado):
+    return [
+        previsao[campo]
+        for previsao in resultado['previsoes']
+        for campo in ('previsao_reservas', 'limite_inferior', 'limite_superior')
+    ]
+
+
+def test_previsao_com_uma_linha_de_historico_vale_zero():
+    # Com uma única linha a correlação de tendência é NaN; a previsão vale 0, não NaN
+    resultado = PrevisaoDemanda().gerar_previsao_demanda(montar_historico([4]), dias_previsao=7)
+
+    assert len(resultado['previsoes']) == 7
+    assert valores_previstos(resultado) == [0] * 21
+
+
+def test_previsao_com_historico_constante_nao_gera_nan():
+    # Série constante também dá correlação NaN (variância zero)
+    resultado = PrevisaoDemanda().gerar_previsao_demanda(montar_historico([3] * 10), dias_previsao=5)
+
+    assert not any(math.isnan(valor) for valor in valores_previstos(resultado))
+    assert valores_previstos(resultado) == [0] * 15
+
+
+def test_previsao_com_tendencia_valida():
+    resultado = PrevisaoDemanda().gerar_previsao_demanda(montar_historico(list(range(1, 15))), dias_previsao=3)
+
+    previsoes = [previsao['previsao_reservas'] for previsao in resultado['previsoes']]
+    assert all(valor > 0 for valor in previsoes)
+    assert resultado['previsoes'][0]['data'] == '2024-03-15'
+
+
+def test_recomendacoes_em_lote_agregam_perfil_por_cliente():
+    df = pd.DataFrame({
+        'cliente_email': ['a', 'b', 'a', 'a', 'b'],
+        'tipo_quarto': ['suite', 'dormitorio', 'privado', 'suite', 'privado'],
+        'valor_total': [250.0, 40.0, 180.0, None, 60.0],
+        'num_hospedes': [2, 4, 2, 2, 3],
+        'checkin': pd.to_datetime(['2024-05-02', '2024-01-10', '2024-02-01', '2024-05-20', '2024-03-05']),
+        'servicos_extras': [['spa'], [], ['kayak', 'spa'], ['kayak', 'tour', 'bike'], ['tour']]
+    })
+
+    recomendacoes = SistemaRecomendacao().gerar_recomendacoes_clientes(df)
+
+    assert [r['cliente_email'] for r in recomendacoes] == ['a', 'b']
+    perfil_a, perfil_b = (r['recomendacoes'] for r in recomendacoes)
+    assert perfil_a['tipo_quarto_sugerido'] == 'suite'
+    assert perfil_a['servicos_sugeridos'] == ['spa', 'kayak', 'tour']
+    assert perfil_a['melhor_epoca_visita'] == 'Maio'
+    assert perfil_a['oferta_personalizada'] == 'Upgrade gratuito para quarto premium'
+    assert perfil_a['desconto_fidelidade'] == 15
+    # Empate entre tipos de quarto e meses fica com o primeiro tipo e o menor mês
+    assert perfil_b['tipo_quarto_sugerido'] == 'dormitorio'
+    assert perfil_b['melhor_epoca_visita'] == 'Janeiro'
+    assert perfil_b['atividades_sugeridas'][:2] == ['Tour familiar cenotes', 'Atividades grupo']
+    assert SistemaRecomendacao().gerar_recomendacoes_cliente('b', df) == perfil_b